@@ -7,6 +7,7 @@ from typing import Optional
 
 import matplotlib.pyplot as plt
 
+from src.db_api import init_db
 from src.tracker import Tracker, Log, today, fmt
 
 
@@ -122,6 +123,7 @@ def main() -> None:
     args = parser.parse_args()
     sep = '\n' + '_' * 70 + '\n'
 
+    init_db()
     log = Log()
     tracker = Tracker(log)
 
@@ -4,7 +4,7 @@ import logging
 from collections import defaultdict
 from typing import Any
 
-import ujson
+import orjson
 from pydantic import BaseModel, ValidationError, validator, constr, conint
 from sanic import Sanic, Request, response, HTTPResponse
 from sanic_jinja2 import SanicJinja2
@@ -19,8 +19,12 @@ app = Sanic(__name__, log_config=logger_.LOGGING_CONFIG)
 app.static('/static', './static')
 
 session = Session(app)
-jinja = SanicJinja2(app, session=session)
+# templates are compiled once and never checked for changes,
+# so restart the server after editing them
+jinja = SanicJinja2(app, session=session, auto_reload=False)
+jinja.add_env('fmt', trc.fmt, scope='filters')
 
+db_api.init_db()
 log = trc.Log(full_info=True)
 tracker = trc.Tracker(log)
 logger = logging.getLogger('ReadingTracker')
@@ -106,12 +110,28 @@ class LogRecord(BaseModel):
         return repr(self)
 
 
+MATERIAL_FIELDS = tuple(Material.__fields__)
+NOTE_FIELDS = tuple(Note.__fields__)
+LOG_RECORD_FIELDS = tuple(LogRecord.__fields__)
+
+
+def get_form(request: Request,
+             fields: tuple[str, ...]) -> dict[str, str]:
+    """ Get the first value of every given field sent in the form """
+    form = request.form
+
+    return {
+        field: value
+        for field in fields
+        if (value := form.get(field)) is not None
+    }
+
+
 @app.get('/materials/queue')
 @jinja.template('queue.html')
 async def get_queue(request: Request) -> dict[str, Any]:
     return {
-        'estimates': tracker.estimate(),
-        'DATE_FORMAT': trc.DATE_FORMAT
+        'estimates': tracker.estimate()
     }
 
 
@@ -130,14 +150,12 @@ async def add_material(request: Request) -> dict[str, Any]:
 @app.post('/materials/add')
 async def add_material(request: Request) -> HTTPResponse:
     """ Add a material to the queue """
-    key_val = {
-        key: val[0]
-        for key, val in request.form.items()
-    }
+    key_val = get_form(request, MATERIAL_FIELDS)
     try:
         material = Material(**key_val)
     except ValidationError as e:
-        context = ujson.dumps(e.errors(), indent=4)
+        context = orjson.dumps(
+            e.errors(), option=orjson.OPT_INDENT_2, default=str).decode()
         logger.warning(f"Validation error:\n{context}")
 
         jinja.flash(
@@ -199,8 +217,7 @@ async def get_reading_materials(request: Request) -> dict[str, Any]:
     statistics = tracker.statistics(tracker.reading)
 
     return {
-        'statistics': statistics,
-        'DATE_FORMAT': trc.DATE_FORMAT
+        'statistics': statistics
     }
 
 
@@ -210,8 +227,7 @@ async def get_completed_materials(request: Request) -> dict:
     statistics = tracker.statistics(tracker.processed)
 
     return {
-        'statistics': statistics,
-        'DATE_FORMAT': trc.DATE_FORMAT
+        'statistics': statistics
     }
 
 
@@ -220,7 +236,6 @@ async def get_completed_materials(request: Request) -> dict:
 async def get_reading_log(request: Request) -> dict[str, Any]:
     return {
         'log': log[::-1].log,
-        'DATE_FORMAT': trc.DATE_FORMAT,
         'EXPECTED_COUNT': trc.PAGES_PER_DAY
     }
 
@@ -228,10 +243,7 @@ async def get_reading_log(request: Request) -> dict[str, Any]:
 @app.get('/reading_log/add')
 @jinja.template('add_log_record.html')
 async def add_reading_log(request: Request) -> dict[str, Any]:
-    titles = {
-        ms.material.material_id: ms.material.title
-        for ms in tracker.reading
-    }
+    titles = db_api.get_assigned_titles(completed=False)
     return {
         'material_id': log.reading_material,
         'titles': titles,
@@ -241,15 +253,13 @@ async def add_reading_log(request: Request) -> dict[str, Any]:
 
 @app.post('/reading_log/add')
 async def add_log_record(request: Request) -> HTTPResponse:
-    key_val = {
-        key: val[0]
-        for key, val in request.form.items()
-    }
+    key_val = get_form(request, LOG_RECORD_FIELDS)
 
     try:
         record = LogRecord(**key_val)
     except ValidationError as e:
-        context = ujson.dumps(e.errors(), indent=4)
+        context = orjson.dumps(
+            e.errors(), option=orjson.OPT_INDENT_2, default=str).decode()
         logger.warning(f"Validation error:\n{context}")
 
         jinja.flash(
@@ -273,26 +283,17 @@ async def add_log_record(request: Request) -> HTTPResponse:
 @jinja.template('notes.html')
 async def get_notes(request: Request):
     material_id = request.args.get('material_id')
-    all_notes = tracker.get_notes()
-    notes = [
-        note
-        for note in all_notes
-        if material_id is None or note.material_id == int(material_id)
-    ]
+    if material_id is not None:
+        material_id = int(material_id)
+
+    notes = tracker.get_notes(material_id)
 
     if not notes:
         jinja.flash(request, f'No notes {material_id=} found', 'error')
     else:
         jinja.flash(request, f"{len(notes)} notes found", 'success')
     
-    all_ids = {
-        note.material_id
-        for note in all_notes
-    }
-    all_titles = {
-        material_id: db_api.get_title(material_id)
-        for material_id in all_ids
-    }
+    all_titles = db_api.get_notes_titles()
     
     # chapters of the shown materials, 
     #  it should help to create menu
@@ -303,18 +304,14 @@ async def get_notes(request: Request):
     return {
         'notes': notes,
         'all_titles': all_titles,
-        'chapters': chapters,
-        'DATE_FORMAT': trc.DATE_FORMAT
+        'chapters': chapters
     }
 
 
 @app.get('/notes/add')
 @jinja.template('add_note.html')
 async def add_note(request: Request) -> dict[str, Any]:
-    titles = {
-        ms.material.material_id: ms.material.title
-        for ms in tracker.reading + tracker.processed
-    }
+    titles = db_api.get_assigned_titles()
     return {
         'material_id': request.ctx.session.get('material_id', ''),
         'content': request.ctx.session.get('content', ''),
@@ -326,15 +323,13 @@ async def add_note(request: Request) -> dict[str, Any]:
 
 @app.post('/notes/add')
 async def add_note(request: Request) -> HTTPResponse:
-    key_val = {
-        key: val[0]
-        for key, val in request.form.items()
-    }
+    key_val = get_form(request, NOTE_FIELDS)
 
     try:
         note = Note(**key_val)
     except ValidationError as e:
-        context = ujson.dumps(e.errors(), indent=4)
+        context = orjson.dumps(
+            e.errors(), option=orjson.OPT_INDENT_2, default=str).decode()
         logger.warning(f"Validation error:\n{context}")
 
         jinja.flash(
@@ -371,7 +366,8 @@ async def home(request: Request) -> HTTPResponse:
 @app.exception(ValidationError)
 def validation_error_handler(request: Request,
                              exception: ValidationError) -> HTTPResponse:
-    context = ujson.dumps(exception.errors(), indent=4)
+    context = orjson.dumps(
+        exception.errors(), option=orjson.OPT_INDENT_2, default=str).decode()
     logger.error(f"Validation error was not handled:\n{context}")
 
     return response.json(exception.errors(), status=400, indent=4)
@@ -400,7 +396,8 @@ def error_handler(request: Request,
         }
     }
 
-    logger.error(ujson.dumps(context, indent=4))
+    logger.error(orjson.dumps(
+        context, option=orjson.OPT_INDENT_2, default=str).decode())
     return response.json(context, status=500, indent=4)
 
 
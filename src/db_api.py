@@ -1,7 +1,9 @@
-__all__ = ('get_materials', 'get_status', 'get_completed_materials',
+__all__ = ('get_materials', 'get_material', 'get_status', 'get_completed_materials',
            'get_free_materials', 'complete_material', 'get_title',
+           'get_notes_titles', 'get_assigned_titles',
            'start_material', 'add_material', 'get_material_status',
            'get_reading_materials', 'add_note', 'get_notes',
+           'init_db',
            'BaseDBError', 'WrongDate', 'MaterialEvenCompleted',
            'MaterialNotAssigned', 'MaterialNotFound', 'MATERIAL_STATUS')
 
@@ -10,15 +12,18 @@ import logging
 from contextlib import contextmanager
 from dataclasses import dataclass
 from os import environ
-from typing import ContextManager, Callable
+from typing import ContextManager, Callable, Optional
 
 from sqlalchemy import (
     Column, ForeignKey, Integer,
-    String, Date, create_engine, Text
+    String, Date, create_engine, Text, Index,
+    any_, bindparam, select
 )
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.exc import NoResultFound
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.sql.expression import ColumnElement
 
 
 DATE_FORMAT = '%d-%m-%Y'
@@ -27,6 +32,11 @@ Base = declarative_base()
 logger = logging.getLogger('ReadingTracker')
 
 
+def _fmt(date: datetime.date) -> str:
+    # DATE_FORMAT written out, strftime is slower
+    return f"{date.day:02d}-{date.month:02d}-{date.year}"
+
+
 class BaseDBError(Exception):
     pass
 
@@ -72,6 +82,12 @@ class Material(Base):
 
 class Status(Base):
     __tablename__ = 'status'
+    # the reading titles lookup reads only material_id and end,
+    #  so it's answered from this index without the table rows,
+    #  the unique index on material_id would need the rows for end
+    __table_args__ = (
+        Index('ix_status_material_end', 'material_id', 'end'),
+    )
 
     status_id = Column(Integer, primary_key=True)
     material_id = Column(Integer,
@@ -83,9 +99,9 @@ class Status(Base):
 
     def __repr__(self) -> str:
         if begin := self.begin:
-            begin = begin.strftime(DATE_FORMAT)
+            begin = _fmt(begin)
         if end := self.end:
-            end = end.strftime(DATE_FORMAT)
+            end = _fmt(end)
 
         return f"{self.__class__.__name__}(" \
                f"id={self.status_id}, material_id={self.material_id}, " \
@@ -105,7 +121,7 @@ class Note(Base):
     page = Column(Integer, nullable=False)
 
     def __repr__(self) -> str:
-        date = self.date.strftime(DATE_FORMAT)
+        date = _fmt(self.date)
 
         return f"{self.__class__.__name__}(" \
                f"id={self.id}, content={self.content}, " \
@@ -140,37 +156,54 @@ class MaterialStatus:
 
 MATERIAL_STATUS = list[MaterialStatus]
 engine = create_engine(environ['DB_URI'], encoding='utf-8')
-Base.metadata.create_all(engine)
+session_factory = sessionmaker(bind=engine, expire_on_commit=False)
+# sessions for queries which don't change anything,
+# there's no need to begin and commit transactions for them
+read_session_factory = sessionmaker(
+    bind=engine.execution_options(isolation_level='AUTOCOMMIT'),
+    expire_on_commit=False
+)
 
 
 def cache(func: Callable) -> Callable:
+    """ Cache results of the function by its args.
+    Exceptions are not cached.
+    Use 'func.clear()' to drop all cached results.
+    """
     results = {}
 
-    def wrapped(arg=None):
+    def wrapped(*args, **kwargs):
         nonlocal results
-
-        if arg in results:
-            logger.debug(f"Result for {func.__name__}({arg})='{results[arg]}' "
+        key = args, tuple(kwargs.items())
+        call = ', '.join([
+            *map(str, args),
+            *(f"{name}={value}" for name, value in kwargs.items())
+        ])
+
+        if key in results:
+            logger.debug(f"Result for {func.__name__}({call})='{results[key]}' "
                          "got from cache")
-            return results[arg]
+            return results[key]
 
-        if arg is None:
-            results[arg] = func()
-        else:
-            results[arg] = func(arg)
+        results[key] = func(*args, **kwargs)
 
-        logger.debug(f"Result for {func.__name__}({arg}) calculated and "
+        logger.debug(f"Result for {func.__name__}({call}) calculated and "
                      f"put into cache"
         )
 
-        return results[arg]
+        return results[key]
 
+    def clear() -> None:
+        logger.debug(f"Cache for {func.__name__} cleared")
+        results.clear()
+
+    wrapped.clear = clear
     return wrapped
 
 
 @contextmanager
 def session(**kwargs) -> ContextManager[Session]:
-    new_session = Session(**kwargs, bind=engine, expire_on_commit=False)
+    new_session = session_factory(**kwargs)
     try:
         logger.info("New session created and yielded")
         yield new_session
@@ -191,11 +224,54 @@ def session(**kwargs) -> ContextManager[Session]:
         logger.info("Session closed")
 
 
-@cache
+@contextmanager
+def read_session(**kwargs) -> ContextManager[Session]:
+    """ Session for read-only queries, nothing is committed. """
+    new_session = read_session_factory(**kwargs)
+    try:
+        logger.info("New read-only session created and yielded")
+        yield new_session
+    except Exception as e:
+        logger.error(f"Error with the session: {e}")
+
+        if isinstance(e, BaseDBError):
+            raise e
+        raise BaseDBError(e)
+    finally:
+        new_session.close()
+        logger.info("Session closed")
+
+
+def init_db() -> None:
+    """ Create the tables and their indexes if they don't exist.
+    Expected to be called once at the start of the app.
+    """
+    logger.info("Creating tables")
+    Base.metadata.create_all(engine)
+
+    # create_all skips the existing tables with their indexes,
+    #  so indexes added later are created here explicitly
+    logger.info("Creating indexes")
+    for index in Status.__table__.indexes:
+        index.create(engine, checkfirst=True)
+
+
 def today() -> datetime.date:
     return datetime.datetime.now().date()
 
 
+def in_ids(column: Column,
+           ids: list[int]) -> ColumnElement:
+    """
+    Get 'column in ids' filter. PostgreSQL gets
+    the ids as one array parameter: 'column = ANY(:ids)',
+    so the statement is the same for any count of ids.
+    """
+    if engine.dialect.name == 'postgresql':
+        return column == any_(bindparam(None, ids, type_=ARRAY(Integer)))
+    return column.in_(ids)
+
+
 def get_materials(*,
                   materials_ids: list[int] = None) -> list[Material]:
     """
@@ -208,44 +284,75 @@ def get_materials(*,
 
     logger.info(f"Getting {how_many} materials")
 
-    with session() as ses:
-        if materials_ids is None:
-            return ses.query(Material).all()
+    stmt = select(Material)
+    if materials_ids is not None:
+        stmt = stmt.where(in_ids(Material.material_id, materials_ids))
 
-        return ses.query(Material).filter(
-            Material.material_id.in_(materials_ids)).all()
+    with read_session() as ses:
+        return ses.execute(stmt).scalars().all()
+
+
+def get_material(*,
+                 material_id: int) -> Optional[Material]:
+    """ Get the material by its primary key.
+    None if it doesn't exist.
+    """
+    logger.info(f"Getting material {material_id=}")
+
+    with read_session() as ses:
+        return ses.get(Material, material_id)
 
 
 @cache
 def get_title(material_id: int, /) -> str:
     logger.info(f"Getting title for {material_id=}")
-    try:
-        return get_materials(materials_ids=[material_id])[0].title
-    except IndexError:
+
+    if (material := get_material(material_id=material_id)) is None:
         logger.warning(f"Material {material_id=} not found")
         return ''
+    return material.title
+
+
+def get_assigned_titles(*,
+                        completed: bool = True) -> dict[int, str]:
+    """
+    Get titles of the assigned materials without loading
+    the whole materials and their statuses.
+
+    :param completed: whether to include completed materials,
+     otherwise get only the reading ones.
+    """
+    logger.info(f"Getting titles for assigned materials, {completed=}")
+
+    stmt = select(Material.material_id, Material.title) \
+        .join(Status, Material.material_id == Status.material_id)
+    if not completed:
+        stmt = stmt.where(Status.end == None)
+
+    with read_session() as ses:
+        return {
+            material_id: title
+            for material_id, title in ses.execute(stmt).all()
+        }
 
 
 @cache
 def does_material_exist(material_id: int, /) -> bool:
     logger.info(f"Whether {material_id=} exists")
-    return len(get_materials(materials_ids=[material_id])) == 1
+    return get_material(material_id=material_id) is not None
 
 
 def get_free_materials() -> list[Material]:
     """ Get all not assigned materials """
     logger.info("Getting free materials")
 
-    with session() as ses:
-        res = ses.query(Status, Material) \
-            .join(Status, isouter=True) \
-            .all()
+    stmt = select(Material) \
+        .join(Status, Material.material_id == Status.material_id,
+              isouter=True) \
+        .where(Status.status_id == None)
 
-    return [
-        material
-        for status, material in res
-        if status is None
-    ]
+    with read_session() as ses:
+        return ses.execute(stmt).scalars().all()
 
 
 def get_reading_materials() -> MATERIAL_STATUS:
@@ -255,11 +362,12 @@ def get_reading_materials() -> MATERIAL_STATUS:
     """
     logger.info("Getting reading materials")
 
-    with session() as ses:
-        res = ses.query(Material, Status)\
-            .join(Status, Material.material_id == Status.material_id) \
-            .filter(Status.end == None) \
-            .all()
+    stmt = select(Material, Status) \
+        .join(Status, Material.material_id == Status.material_id) \
+        .where(Status.end == None)
+
+    with read_session() as ses:
+        res = ses.execute(stmt).all()
 
     return [
         MaterialStatus(material=ms[0], status=ms[1])
@@ -271,11 +379,12 @@ def get_completed_materials() -> MATERIAL_STATUS:
     """ Get all completed materials and their statuses. """
     logger.info("Getting completed materials")
 
-    with session() as ses:
-        res = ses.query(Material, Status)\
-            .join(Status, Material.material_id == Status.material_id)\
-            .filter(Status.end != None)\
-            .all()
+    stmt = select(Material, Status) \
+        .join(Status, Material.material_id == Status.material_id) \
+        .where(Status.end != None)
+
+    with read_session() as ses:
+        res = ses.execute(stmt).all()
 
     return [
         MaterialStatus(material=ms[0], status=ms[1])
@@ -295,12 +404,12 @@ def get_status(*,
 
     logger.info(f"Getting {how_many} statuses")
 
-    with session() as ses:
-        if status_ids is None:
-            return ses.query(Status).all()
+    stmt = select(Status)
+    if status_ids is not None:
+        stmt = stmt.where(in_ids(Status.status_id, status_ids))
 
-        return ses.query(Status).filter(
-            Status.status_id.in_(status_ids)).all()
+    with read_session() as ses:
+        return ses.execute(stmt).scalars().all()
 
 
 def get_material_status(*,
@@ -311,11 +420,11 @@ def get_material_status(*,
     """
     logger.info(f"Getting status for material {material_id=}")
 
-    with session() as ses:
-        query = ses.query(Status).filter(
-            Status.material_id == material_id)
+    stmt = select(Status).where(Status.material_id == material_id)
+
+    with read_session() as ses:
         try:
-            return query.one()
+            return ses.execute(stmt).scalar_one()
         except NoResultFound as e:
             msg = f"Material {material_id=} not found"
             logger.error(f"{msg}\n{e}")
@@ -341,6 +450,10 @@ def add_material(*,
 
         logger.info(f"Material added, {material.material_id}")
 
+    # missing materials are cached too
+    get_title.clear()
+    does_material_exist.clear()
+
 
 def start_material(*,
                    material_id: int,
@@ -355,10 +468,11 @@ def start_material(*,
     :exception WrongDate: if 'start_time' is better than today.
     :exception MaterialNotFound: if material with the id not found.
     """
-    start_date = start_date or today()
+    today_ = today()
+    start_date = start_date or today_
     logger.info(f"Starting material {material_id=} at {start_date=}")
 
-    if start_date > today():
+    if start_date > today_:
         raise WrongDate("Start date must be less than today,"
                         "but %s found", start_date)
 
@@ -393,10 +507,8 @@ def complete_material(*,
 
     with session() as ses:
         status = ses.query(Status).filter(
-            Status.material_id == material_id).all()
-        try:
-            status = status[0]
-        except IndexError:
+            Status.material_id == material_id).one_or_none()
+        if status is None:
             raise MaterialNotAssigned(f"Material {material_id=} not assigned")
 
         if status.end is not None:
@@ -421,12 +533,29 @@ def get_notes(*,
 
     logger.info(f"Getting notes for {how_many} materials")
 
-    with session() as ses:
-        if materials_ids:
-            return ses.query(Note).filter(
-                Note.material_id.in_(materials_ids)).all()
+    stmt = select(Note)
+    if materials_ids:
+        stmt = stmt.where(in_ids(Note.material_id, materials_ids))
+
+    with read_session() as ses:
+        return ses.execute(stmt).scalars().all()
+
+
+@cache
+def get_notes_titles() -> dict[int, str]:
+    """ Get titles of the materials having notes in one query.
+    The result is cached until a note is added.
+    """
+    logger.info("Getting titles for materials with notes")
 
-        return ses.query(Note).all()
+    stmt = select(Material.material_id, Material.title) \
+        .where(Material.material_id.in_(select(Note.material_id)))
+
+    with read_session() as ses:
+        return {
+            material_id: title
+            for material_id, title in ses.execute(stmt).all()
+        }
 
 
 def add_note(*,
@@ -450,3 +579,5 @@ def add_note(*,
 
         ses.add(note)
         logger.info("Note added")
+
+    get_notes_titles.clear()
@@ -1,20 +1,24 @@
 #!/usr/bin/env python3
 import copy
 import datetime
+import functools
 import logging
+import mmap
 from dataclasses import dataclass
 from datetime import timedelta
 from pathlib import Path
 from typing import Union, Optional, Iterator, Iterable
 
-import ujson
+import orjson
 
 import src.db_api as db
 
 
 DATA_FOLDER = Path('data')
 PAGES_PER_DAY = 50
-INDENT = 2
+A_DAY = timedelta(days=1)
+# log files bigger than that are memory-mapped on loading
+MMAP_THRESHOLD = 1024 * 1024
 
 DATE_FORMAT = '%d-%m-%Y'
 
@@ -77,9 +81,12 @@ class MinMax:
 
 @dataclass(unsafe_hash=True)
 class LogRecord:
+    __slots__ = 'count', 'material_id', 'material_title'
+
     count: int
     material_id: int
-    material_title: Optional[str] = None
+    # there's no default value, it would conflict with __slots__
+    material_title: Optional[str]
 
     def dict(self) -> dict:
         return {
@@ -130,16 +137,15 @@ class LogStatistics:
             for field in self.__annotations__.keys()
         }
 
-    def __str__(self) -> str:
-        min_ = '\n'.join(
-            f"\t{field.capitalize()}: {value}"
-            for field, value in self.min.dict(exclude={'material_id'}).items()
-        )
+    @staticmethod
+    def _min_max(min_max: MinMax) -> str:
+        return f"\tDate: {min_max.date}\n" \
+               f"\tCount: {min_max.count}\n" \
+               f"\tMaterial_title: {min_max.material_title}"
 
-        max_ = '\n'.join(
-            f"\t{field.capitalize()}: {value}"
-            for field, value in self.max.dict(exclude={'material_id'}).items()
-        )
+    def __str__(self) -> str:
+        min_ = self._min_max(self.min)
+        max_ = self._min_max(self.max)
 
         return f"Start: {fmt(self.start_date)}\n" \
                f"Stop: {fmt(self.stop_date)}\n" \
@@ -260,7 +266,22 @@ def today() -> datetime.date:
 
 
 def yesterday() -> datetime.date:
-    return today() - timedelta(days=1)
+    return today() - A_DAY
+
+
+@functools.lru_cache(maxsize=4096)
+def _parse_date(date: str) -> datetime.date:
+    # specialized to DATE_FORMAT: 'dd-mm-yyyy'
+    if len(date) == 10 and date[2] == date[5] == '-':
+        day, month, year = date[:2], date[3:5], date[6:]
+        # int() accepts signs and spaces, strptime doesn't
+        if all(s.isascii() and s.isdigit() for s in (day, month, year)):
+            try:
+                return datetime.date(int(year), int(month), int(day))
+            except ValueError:
+                pass
+
+    return datetime.datetime.strptime(date, DATE_FORMAT).date()
 
 
 def to_datetime(date) -> Optional[datetime.date]:
@@ -275,8 +296,7 @@ def to_datetime(date) -> Optional[datetime.date]:
 
     if isinstance(date, str):
         try:
-            date = datetime.datetime.strptime(date, DATE_FORMAT)
-            date = date.date()
+            date = _parse_date(date)
         except ValueError as e:
             raise ValueError(f"Wrong str format\n{e}:{date}")
         else:
@@ -307,11 +327,12 @@ def time_span(span: Union[timedelta, int]) -> str:
 
 
 def fmt(date: datetime.date) -> str:
-    return date.strftime(DATE_FORMAT)
+    # the same as date.strftime(DATE_FORMAT), but faster
+    return f"{date.day:02d}-{date.month:02d}-{date.year}"
 
 
 class Log:
-    __slots__ = '__log'
+    __slots__ = '__log', '__materials', '__total'
 
     LOG_PATH = DATA_FOLDER / 'log.json'
 
@@ -328,6 +349,9 @@ class Log:
             logger.error(f"When load the log: {e}")
             raise LoadingLogError(e)
 
+        self.__materials = self._get_materials_index(self.__log)
+        self.__total = self._get_total(self.__log)
+
     @property
     def log(self) -> dict[datetime.date, LogRecord]:
         return self.__log
@@ -343,8 +367,8 @@ class Log:
         :exception ReadingLogIsEmpty:
         """
         try:
-            return list(self.log.keys())[0]
-        except IndexError:
+            return next(iter(self.log))
+        except StopIteration:
             msg = "Reading log is empty, no start date"
             logger.warning(msg)
             raise ReadingLogIsEmpty(msg)
@@ -356,8 +380,8 @@ class Log:
         :exception ReadingLogIsEmpty:
         """
         try:
-            return list(self.log.keys())[-1]
-        except IndexError:
+            return next(reversed(self.log))
+        except StopIteration:
             msg = "Reading log is empty, no stop date"
             logger.warning(msg)
             raise ReadingLogIsEmpty(msg)
@@ -369,12 +393,23 @@ class Log:
         :exception ReadingLogIsEmpty:
         """
         try:
-            return list(self.log.values())[-1].material_id
-        except IndexError:
+            return next(reversed(self.log.values())).material_id
+        except StopIteration:
             msg = "Reading log is empty, no materials reading"
             logger.warning(msg)
             raise ReadingLogIsEmpty(msg)
 
+    def _read(self) -> dict:
+        """ Read and parse the JSON file of the log. """
+        path = self.path
+        if path.stat().st_size < MMAP_THRESHOLD:
+            return orjson.loads(path.read_bytes())
+
+        with path.open('rb') as f, \
+                mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm, \
+                memoryview(mm) as view:
+            return orjson.loads(view)
+
     def _get_log(self,
                  *,
                  full_info: bool = False) -> dict[datetime.date, LogRecord]:
@@ -389,13 +424,12 @@ class Log:
 
         :exception DatabaseError:
         """
-        with self.path.open(encoding='utf-8') as f:
-            log = ujson.load(f)
+        log = self._read()
 
         log_records = {}
         for date, info in log.items():
             date = to_datetime(date)
-            record = LogRecord(**info)
+            record = LogRecord(**info, material_title=None)
 
             if full_info:
                 try:
@@ -407,7 +441,26 @@ class Log:
                     record.material_title = material_title
 
             log_records[date] = record
-        return log_records
+
+        # the log is kept sorted by date, _set_log appends to the end
+        return dict(sorted(log_records.items(), key=lambda item: item[0]))
+
+    @staticmethod
+    def _get_materials_index(
+            log: dict[datetime.date, LogRecord]) -> dict[int, list[datetime.date]]:
+        """ Get dates of the log records grouped by material id. """
+        materials = {}
+        for date, info in log.items():
+            materials.setdefault(info.material_id, []).append(date)
+
+        return materials
+
+    @staticmethod
+    def _get_total(log: dict[datetime.date, LogRecord]) -> int:
+        return sum(
+            info.count
+            for info in log.values()
+        )
 
     def _set_log(self,
                  date: datetime.date,
@@ -451,8 +504,8 @@ class Log:
             material_title=material_title
         )
         self.__log[date] = record
-
-        self.__log = dict(sorted(self.log.items(), key=lambda i: i[0]))
+        self.__materials.setdefault(record.material_id, []).append(date)
+        self.__total += count
 
         self.dump()
 
@@ -508,20 +561,18 @@ class Log:
             for date, info in self.log.items()
         }
 
-        with self.path.open('w', encoding='utf-8') as f:
-            ujson.dump(data, f, indent=INDENT)
+        self.path.write_bytes(
+            orjson.dumps(data, option=orjson.OPT_INDENT_2)
+        )
 
         logger.debug("Log dumped")
 
     @property
     def total(self) -> int:
-        """ Get total count of read pages """
-        logger.debug("Calculating total count of read pages in log")
-
-        return sum(
-            info.count
-            for info in self.log.values()
-        )
+        """ Get total count of read pages.
+        It's calculated on loading and updated by _set_log.
+        """
+        return self.__total
 
     @property
     def duration(self) -> int:
@@ -561,7 +612,7 @@ class Log:
             raise ReadingLogIsEmpty
 
         date, info = min(
-            [(date, info) for date, info in self.log.items()],
+            self.log.items(),
             key=lambda item: item[1].count
         )
         return MinMax(
@@ -583,7 +634,7 @@ class Log:
             raise ReadingLogIsEmpty
 
         date, info = max(
-            [(date, info) for date, info in self.log.items()],
+            self.log.items(),
             key=lambda item: item[1].count
         )
 
@@ -629,13 +680,15 @@ class Log:
         if not self.log:
             return
 
-        step = timedelta(days=1)
+        log, stop = self.log, self.stop
+        step = A_DAY
         iter_ = self.start
         last_material_id = -1
 
-        while iter_ <= self.stop:
-            info = self.log.get(iter_)
-            info = info or LogRecord(material_id=last_material_id, count=0)
+        while iter_ <= stop:
+            info = log.get(iter_)
+            info = info or LogRecord(
+                material_id=last_material_id, count=0, material_title=None)
 
             if (material_id := info.material_id) != last_material_id:
                 last_material_id = material_id
@@ -672,9 +725,8 @@ class Log:
             raise NoMaterialInLog
 
         return sum(
-            info.count
-            for info in self.log.values()
-            if info.material_id == material_id
+            self.log[date].count
+            for date in self.__materials[material_id]
         )
 
     def m_lost_time(self,
@@ -706,16 +758,12 @@ class Log:
         if material_id not in self:
             raise NoMaterialInLog
 
-        sample = [
-            (date, info)
-            for date, info in self.log.items()
-            if info.material_id == material_id
-        ]
-
-        date, info = min(
-            sample,
-            key=lambda item: item[1].count
+        date = min(
+            self.__materials[material_id],
+            key=lambda date_: self.log[date_].count
         )
+        info = self.log[date]
+
         return MinMax(
             date=date,
             **info.dict()
@@ -733,16 +781,12 @@ class Log:
         if material_id not in self:
             raise NoMaterialInLog
 
-        sample = [
-            (date, info)
-            for date, info in self.log.items()
-            if info.material_id == material_id
-        ]
-
-        date, info = max(
-            sample,
-            key=lambda item: item[1].count
+        date = max(
+            self.__materials[material_id],
+            key=lambda date_: self.log[date_].count
         )
+        info = self.log[date]
+
         return MinMax(
             date=date,
             **info.dict()
@@ -850,15 +894,18 @@ class Log:
         iter_ = start
         new_log_content = {}
         new_log = self.copy()
+        log = new_log.log
 
         while True:
             if inside_if(start, iter_, stop):
-                if iter_ in new_log.log:
-                    new_log_content[iter_] = new_log.log[iter_]
+                if iter_ in log:
+                    new_log_content[iter_] = log[iter_]
             else:
                 break
             iter_ += step
         new_log.__log = new_log_content
+        new_log.__materials = self._get_materials_index(new_log_content)
+        new_log.__total = self._get_total(new_log_content)
         return new_log
 
     def __len__(self) -> int:
@@ -867,13 +914,7 @@ class Log:
     def __contains__(self,
                      material_id: int) -> bool:
         logger.debug(f"Whether {material_id=} is in a log record")
-        if not self.log:
-            return False
-
-        return any(
-            info.material_id == material_id
-            for info in self.log.values()
-        )
+        return material_id in self.__materials
 
     def __str__(self) -> str:
         """
@@ -881,9 +922,8 @@ class Log:
         add title of it in the first day and '...' to next
         ones instead of printing out the title every time.
         """
-        res, is_first = '', True
+        items = []
         last_material_id, last_material_title = -1, ''
-        new_line = '\n'
 
         for date, info in self.log.items():
             if (material_id := info.material_id) != last_material_id:
@@ -899,13 +939,9 @@ class Log:
             else:
                 last_material_title = '...'
 
-            item = f"{new_line * (not is_first)}{fmt(date)}: " \
-                   f"{info.count}, {last_material_title}"
-
-            is_first = False
-            res = f"{res}{item}"
+            items += [f"{fmt(date)}: {info.count}, {last_material_title}"]
 
-        return res
+        return '\n'.join(items)
 
     def __repr__(self) -> str:
         log_records = ', '.join(
@@ -916,11 +952,13 @@ class Log:
 
 
 class Tracker:
-    __slots__ = '__log',
+    __slots__ = '__log', '__statistics'
 
     def __init__(self,
                  log: Log) -> None:
         self.__log = log
+        # material_id: (version, statistics)
+        self.__statistics = {}
 
     @property
     def queue(self) -> list[db.Material]:
@@ -988,13 +1026,26 @@ class Tracker:
                                 *,
                                 material: db.Material = None,
                                 status: db.Status = None) -> MaterialStatistics:
-        """ Calculate statistics for reading or completed material """
-        logger.debug(f"Calculating material statistics for {material_id=}")
+        """ Calculate statistics for reading or completed material.
 
+        The result is cached until the log gets a new
+        record, the material is completed or the day changes.
+        """
         material = material or self.get_material(material_id)
         status = status or self.get_status(material_id)
 
         assert material.material_id == status.material_id == material_id
+
+        today_ = today()
+        version = len(self.log), status.end, today_
+        if (cached := self.__statistics.get(material_id)) is not None:
+            cached_version, statistics = cached
+            if cached_version == version:
+                logger.debug(f"Material statistics for {material_id=} "
+                             "got from cache")
+                return statistics
+
+        logger.debug(f"Calculating material statistics for {material_id=}")
         material_exists = material_id in self.log
 
         if material_exists:
@@ -1012,11 +1063,11 @@ class Tracker:
         if status.end is None:
             remaining_pages = material.pages - total
             remaining_days = round(remaining_pages / avg)
-            would_be_completed = today() + timedelta(days=remaining_days)
+            would_be_completed = today_ + timedelta(days=remaining_days)
         else:
             would_be_completed = remaining_days = remaining_pages = None
 
-        return MaterialStatistics(
+        statistics = MaterialStatistics(
             material=material,
             started=status.begin,
             completed=status.end,
@@ -1030,6 +1081,9 @@ class Tracker:
             remaining_days=remaining_days,
             would_be_completed=would_be_completed
         )
+        self.__statistics[material_id] = version, statistics
+
+        return statistics
     
     def statistics(self, 
                    materials: list[db.MaterialStatus]) -> list[MaterialStatistics]:
@@ -1042,28 +1096,28 @@ class Tracker:
 
     def estimate(self) -> list[MaterialEstimate]:
         """ Get materials from queue with estimated time to read """
-        a_day = timedelta(days=1)
-
         # start when all reading material will be completed
         start = self._end_of_reading()
         avg = self.log.average
 
-        last_date = start + a_day
+        # the schedule is calculated in ordinal days,
+        # dates are created only for the estimates
+        last_date = start.toordinal() + 1
         forecasts = []
 
         for material in self.queue:
             expected_duration = round(material.pages / avg)
-            expected_end = last_date + timedelta(days=expected_duration)
+            expected_end = last_date + expected_duration
 
             forecast = MaterialEstimate(
                 material=material,
-                will_be_started=last_date,
-                will_be_completed=expected_end,
+                will_be_started=datetime.date.fromordinal(last_date),
+                will_be_completed=datetime.date.fromordinal(expected_end),
                 expected_duration=expected_duration
             )
             forecasts += [forecast]
 
-            last_date = expected_end + a_day
+            last_date = expected_end + 1
 
         return forecasts
 
@@ -1147,15 +1201,17 @@ class Tracker:
         logger.debug(f"Getting material {material_id=}")
 
         try:
-            return db.get_materials(materials_ids=[material_id])[0]
-        except IndexError:
-            msg = f"Material {material_id=} not found"
-            logger.warning(msg)
-            raise DatabaseError(msg)
+            material = db.get_material(material_id=material_id)
         except db.BaseDBError as e:
             logger.error(e)
             raise DatabaseError(e)
 
+        if material is None:
+            msg = f"Material {material_id=} not found"
+            logger.warning(msg)
+            raise DatabaseError(msg)
+        return material
+
     @staticmethod
     def get_status(material_id: int) -> db.Status:
         """